@@ -56,6 +56,11 @@ class CallSignaturesChoose(Choose):
         """
         return None
 
+    def clear_items(self):
+        """Remove all lines from the tab, e.g. before the results of a new run are added."""
+        self.items = []
+        self.Refresh()
+
     def add_item(self, call, signature):
         """
         Add a line to the tab.
@@ -68,7 +73,16 @@ class CallSignaturesChoose(Choose):
 
         After the line is added, refresh the tab to make the new line visible.
         """
-        self.items.append(
+        self.add_items([(call, signature)])
+
+    def add_items(self, matches):
+        """
+        Add a line to the tab for each pair of a function call and a Call Signature.
+
+        The tab is only refreshed once, after all lines are added.
+        """
+        self.items.extend(
             (hex(call.address), signature.technique, str(call), signature.filename)
+            for call, signature in matches
         )
         self.Refresh()
@@ -1,6 +1,9 @@
 from enum import Enum
 
-from typing import List
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 
 class Rule:
@@ -8,6 +11,20 @@ class Rule:
 
     OPERATORS = ("true", "equals", "contains", "contains_in", "in")
 
+    __slots__ = (
+        "element",
+        "argument_index",
+        "operator",
+        "value",
+        "type",
+        "_value_cf",
+        "_value_set",
+        "_substrings",
+        "_automaton",
+        "_match_impl",
+        "apply",
+    )
+
     class Type(Enum):
         """The type of data used in the rule."""
 
@@ -44,6 +61,30 @@ class Rule:
             if isinstance(self.value, str):
                 self.value = bytes.fromhex(self.value)
 
+        self._value_cf = self._casefold(self.value)
+
+        # Look up elements in a set instead of scanning the list, if all elements can be hashed
+        self._value_set = None
+        if self.operator == self._in and isinstance(self._value_cf, list):
+            try:
+                self._value_set = frozenset(self._value_cf)
+            except TypeError:
+                pass
+
+        # Keep only the strings of a contains_in rule, and search for all of them at once if pyahocorasick is installed
+        self._substrings = None
+        self._automaton = None
+        if self.operator == self._contains_in and isinstance(self._value_cf, list):
+            self._substrings = tuple(
+                value for value in self._value_cf if isinstance(value, str)
+            )
+
+            if ahocorasick is not None:
+                self._automaton = self._build_automaton(self._substrings)
+
+        self._match_impl = self._get_match_impl()
+        self.apply = self._get_apply()
+
     def __str__(self):
         """Represent the rule as string."""
         if self.value:
@@ -81,21 +122,161 @@ class Rule:
 
         return Rule.Type.UNKNOWN
 
-    def match(self, other) -> bool:
+    def _get_match_impl(self):
+        """
+        Select the function that compares the rule to a value.
+
+        As the type and operator of a rule are known beforehand, most rules can use a specialized function
+        that only checks the type of the other value once. Other rules use the generic comparison.
         """
-        Compare the rule to a value.
+        if self._get_type(self.value) != self.type:
+            return self._match_generic
+
+        if self.type == Rule.Type.STRING:
+            if self.operator == self._equals and isinstance(self.value, str):
+                return self._match_str_equals
+
+            elif self.operator == self._contains and isinstance(self.value, str):
+                return self._match_str_contains
+
+            elif self.operator == self._in and self._value_set is not None:
+                return self._match_str_in_set
+
+            elif self.operator == self._contains_in and isinstance(self.value, list):
+                return self._match_str_contains_in
+
+        elif self.type == Rule.Type.NUMBER:
+            if self.operator == self._equals and isinstance(self.value, int):
+                return self._match_number_equals
+
+            elif self.operator == self._in and self._value_set is not None:
+                return self._match_number_in_set
+
+        elif self.type == Rule.Type.BYTES:
+            if self.operator == self._equals and isinstance(self.value, bytes):
+                return self._match_bytes_equals
+
+            elif self.operator == self._in and self._value_set is not None:
+                return self._match_bytes_in_set
+
+        return self._match_generic
+
+    def _get_apply(self):
+        """
+        Select the function that applies the rule to a call.
+
+        Each function extracts the element of the call the rule applies to and compares it to the rule,
+        so the element does not need to be looked up every time the rule is applied.
+        """
+        if self.element == "function name":
+            return self._apply_function_name
+
+        elif self.element == "number of arguments":
+            return self._apply_number_of_arguments
+
+        elif self.element == "argument":
+            return self._apply_argument
+
+        elif self.element == "any argument":
+            return self._apply_any_argument
+
+        raise ValueError(f"Unknown name: {self.element}")
+
+    # Call elements
+
+    def _apply_function_name(self, call) -> bool:
+        """
+        Compare the rule to the function name of a call.
+
+        If the function name of the call is unknown, the result is considered a match.
+        """
+        return call.function_name_cf is None or self._match_impl(call.function_name_cf)
+
+    def _apply_number_of_arguments(self, call) -> bool:
+        """Compare the rule to the number of arguments of a call."""
+        return self._match_impl(call.number_of_arguments)
+
+    def _apply_argument(self, call) -> bool:
+        """Compare the rule to one argument of a call, calls with too few arguments do not match."""
+        return self.argument_index < call.number_of_arguments and self._match_impl(
+            call.arguments_cf[self.argument_index]
+        )
+
+    def _apply_any_argument(self, call) -> bool:
+        """Check whether any argument of a call matches the rule."""
+        return any(map(self._match_impl, call.arguments_cf))
 
-        If the other value in the rule is unknown and the rule applies to function names,
-        the result is considered a match.
+    # Comparisons
 
-        First check if the types match and if they do, check if the values match (using the rule operator).
+    def _match_generic(self, other) -> bool:
+        """
+        Deduce the type of `other` and compare it to the rule using the operator.
+
+        Strings in `other` are expected to be casefolded already.
         """
         other_type = self._get_type(other)
+        return other_type == self.type and self.operator(other)
+
+    def _match_str_equals(self, other) -> bool:
+        """Check whether `other` is a string equal to the rule value."""
+        return type(other) is str and other == self._value_cf
+
+    def _match_str_contains(self, other) -> bool:
+        """Check whether `other` is a string containing the rule value."""
+        return type(other) is str and self._value_cf in other
+
+    def _match_str_in_set(self, other) -> bool:
+        """Check whether `other` is a string in the rule values."""
+        return type(other) is str and other in self._value_set
+
+    def _match_str_contains_in(self, other) -> bool:
+        """Check whether `other` is a string containing one of the rule values."""
+        return type(other) is str and self._contains_in(other)
+
+    def _match_number_equals(self, other) -> bool:
+        """Check whether `other` is a number equal to the rule value."""
+        return type(other) is int and other == self.value
+
+    def _match_number_in_set(self, other) -> bool:
+        """Check whether `other` is a number in the rule values."""
+        return type(other) is int and other in self._value_set
+
+    def _match_bytes_equals(self, other) -> bool:
+        """Check whether `other` is a bytes object equal to the rule value."""
+        return type(other) is bytes and other == self.value
+
+    def _match_bytes_in_set(self, other) -> bool:
+        """Check whether `other` is a bytes object in the rule values."""
+        return type(other) is bytes and other in self._value_set
+
+    @staticmethod
+    def _casefold(data):
+        """Casefold a string or the string elements of a list, other data is returned as is."""
+        if isinstance(data, str):
+            return data.casefold()
+
+        elif isinstance(data, list):
+            return [e.casefold() if isinstance(e, str) else e for e in data]
+
+        return data
+
+    @staticmethod
+    def _build_automaton(strings):
+        """
+        Build an Aho-Corasick automaton that finds `strings`.
+
+        The empty string is a substring of every string, but cannot be added to an automaton.
+        In that case (or if there are no strings), no automaton is built.
+        """
+        if not strings or "" in strings:
+            return None
 
-        if other_type == Rule.Type.UNKNOWN and self.element in ("function name",):
-            return True
+        automaton = ahocorasick.Automaton()
+        for string in strings:
+            automaton.add_word(string, string)
+        automaton.make_automaton()
 
-        return other_type == self.type and self.operator(self.value, other)
+        return automaton
 
     # Operators
 
@@ -104,54 +285,48 @@ class Rule:
         """Return true."""
         return True
 
-    @staticmethod
-    def _equals(value, other) -> bool:
+    def _equals(self, other) -> bool:
         """
-        Check whether `value` and `other` are equal.
+        Check whether the rule value and `other` are equal.
 
         Strings comparisons are case-insensitive.
         """
-        if isinstance(value, str) and isinstance(other, str):
-            return value.casefold() == other.casefold()
+        if isinstance(self._value_cf, str) and isinstance(other, str):
+            return self._value_cf == other
 
-        return value == other
+        return self.value == other
 
-    @staticmethod
-    def _contains(value: str, other: str) -> bool:
-        """Check whether `value` is a substring of `other`."""
-        if not isinstance(value, str) or not isinstance(other, str):
+    def _contains(self, other: str) -> bool:
+        """Check whether the rule value is a substring of `other`."""
+        if not isinstance(self._value_cf, str) or not isinstance(other, str):
             return False
 
-        return value.casefold() in other.casefold()
+        return self._value_cf in other
 
-    @staticmethod
-    def _in(values: List, other):
+    def _in(self, other) -> bool:
         """
-        Check whether `other` is an element of `values`.
+        Check whether `other` is an element of the rule values.
 
-        This function uses the in operator for the comparison of two values.
+        Strings comparisons are case-insensitive.
         """
-        if not isinstance(values, list):
-            return False
+        if self._value_set is not None:
+            return other in self._value_set
 
-        for value in values:
-            if Rule._equals(value, other):
-                return True
-
-        return False
+        if not isinstance(self._value_cf, list):
+            return False
 
-    @staticmethod
-    def _contains_in(values: List[str], other: str):
-        """
-        Check whether a string element of `values` is a substring of `other`.
+        return other in self._value_cf
 
-        This function uses the contains operator for the string comparison.
-        """
-        if not isinstance(values, list):
+    def _contains_in(self, other: str) -> bool:
+        """Check whether a string element of the rule values is a substring of `other`."""
+        if self._substrings is None or not isinstance(other, str):
             return False
 
-        for value in values:
-            if Rule._contains(value, other):
+        if self._automaton is not None:
+            return next(self._automaton.iter(other), None) is not None
+
+        for substring in self._substrings:
+            if substring in other:
                 return True
 
         return False
@@ -1,6 +1,7 @@
 import os
 import yaml
 import logging
+import itertools
 
 import idaapi
 
@@ -8,6 +9,12 @@ import FIDL.decompiler_utils
 
 from CallSignaturesPlugin.rule import Rule
 
+# Use the (much faster) libyaml based loader, if PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 class Call:
     """
@@ -17,18 +24,30 @@ class Call:
     only this class needs to be changed.
     """
 
-    def __init__(self, call: FIDL.decompiler_utils.callObj):
-        """Extract the necessary information from a function call found by IDA Pro."""
-        self.address = call.ea
+    __slots__ = (
+        "address",
+        "function_name",
+        "function_name_cf",
+        "number_of_arguments",
+        "arguments",
+        "arguments_cf",
+        "_unread_references",
+    )
+
+    def __init__(self, call: FIDL.decompiler_utils.callObj, bytes_arguments=None):
+        """
+        Extract the necessary information from a function call found by IDA Pro.
 
-        if not call.name.startswith("sub_"):
-            self.function_name = call.name
-        else:
-            self.function_name = None
+        Reading the bytes of referenced data is only done for the argument indexes in `bytes_arguments`
+        (or for all arguments if it is None). The other references are only read when the call is represented as a string.
+        """
+        self.address = call.ea
+        self.function_name = self.get_function_name(call)
 
         self.number_of_arguments = len(call.args)
 
         self.arguments = []
+        self._unread_references = {}
         for i in range(len(call.args)):
 
             argument = call.args[i]
@@ -46,11 +65,11 @@ class Call:
                     value = None
 
             elif argument.type == "ref":
-                argument_flags = idaapi.get_flags(argument.val.obj_ea)
-                argument_size = idaapi.get_data_elsize(
-                    argument.val.obj_ea, argument_flags
-                )
-                value = idaapi.get_bytes(argument.val.obj_ea, argument_size)
+                if bytes_arguments is None or i in bytes_arguments:
+                    value = self._get_reference_bytes(argument.val.obj_ea)
+                else:
+                    self._unread_references[i] = argument.val.obj_ea
+                    value = None
 
             elif argument.type == "unk" and argument.val.string is not None:
                 value = argument.val.string
@@ -60,6 +79,37 @@ class Call:
 
             self.arguments.append(value)
 
+        # Casefold the strings once, so they can be compared with every rule without casefolding them again
+        self.function_name_cf = Rule._casefold(self.function_name)
+        self.arguments_cf = Rule._casefold(self.arguments)
+
+    @staticmethod
+    def get_function_name(call: FIDL.decompiler_utils.callObj):
+        """Return the name of the called function, or None if the function has no (known) name."""
+        if call.name.startswith("sub_"):
+            return None
+
+        return call.name
+
+    @staticmethod
+    def _get_reference_bytes(ea):
+        """Read the bytes of the data item at an address."""
+        flags = idaapi.get_flags(ea)
+        size = idaapi.get_data_elsize(ea, flags)
+        return idaapi.get_bytes(ea, size)
+
+    def _read_references(self):
+        """
+        Read the bytes of the references that were skipped when the call was constructed.
+
+        Each reference is only read once. The casefolded arguments are left as is,
+        as no rule can use the bytes of these arguments.
+        """
+        for i, ea in self._unread_references.items():
+            self.arguments[i] = self._get_reference_bytes(ea)
+
+        self._unread_references.clear()
+
     @staticmethod
     def _get_global_string(str_ea):
         """
@@ -77,24 +127,25 @@ class Call:
 
     def __str__(self) -> str:
         """Represent a rule as a string."""
-        argument_string = ""
+        self._read_references()
+
+        arguments = []
         for argument in self.arguments:
             argument_type = Rule._get_type(argument)
 
             if argument_type == Rule.Type.STRING:
-                argument_string += f"'{argument}'"
+                arguments.append(f"'{argument}'")
 
             elif argument_type == Rule.Type.NUMBER:
-                argument_string += str(hex(argument))
+                arguments.append(hex(argument))
 
             elif argument_type == Rule.Type.BYTES:
-                argument_string += f"0x{argument.hex()}"
+                arguments.append(f"0x{argument.hex()}")
 
             else:
-                argument_string += "?"
+                arguments.append("?")
 
-            argument_string += ", "
-        argument_string = argument_string[:-2]
+        argument_string = ", ".join(arguments)
 
         return f"{self.function_name or '?'}({argument_string})"
 
@@ -111,7 +162,7 @@ class Signature:
 
         self.logger.info(f"Loading signature at '{self.path}'")
         with open(self.path) as h_yaml:
-            self._data = yaml.safe_load(h_yaml)["signature"]
+            self._data = yaml.load(h_yaml, Loader=SafeLoader)["signature"]
 
         self.technique = self._data["technique"]
         self.description = self._data.get("description", "")
@@ -120,33 +171,137 @@ class Signature:
         for rule_yaml in self._data["rules"]:
             self.rules.append(Rule(rule_yaml))
 
-    def match(self, call: Call) -> bool:
-        """Iterate through the rules and compare each one with a call."""
+        # As all rules need to match, evaluate the cheapest and most selective rules first
+        self.rules.sort(key=self._rule_order)
+
+        # A rule on the exact number of arguments is checked with a single integer comparison before any other rule
+        self._argc_rule = self._get_argc_rule()
+        self.expected_argc = (
+            self._argc_rule.value if self._argc_rule is not None else None
+        )
+        self._remaining_rules = [
+            rule for rule in self.rules if rule is not self._argc_rule
+        ]
+
+        self._function_name_rule = self._get_function_name_rule()
+        self.function_names = self._get_function_names()
+
+        # The rules that still need to be checked after a SignatureIndex selected the Call Signature
+        self._unkeyed_rules = [
+            rule
+            for rule in self._remaining_rules
+            if rule is not self._function_name_rule
+        ]
+
+    @staticmethod
+    def _rule_order(rule: Rule) -> int:
+        """
+        Rank a rule by how cheap and selective it is.
+
+        1. Comparing the function name to a specific name.
+        2. Comparing the number of arguments.
+        3. Comparing an argument to a specific value.
+        4. Searching for substrings in the function name or an argument.
+        5. Comparing all arguments.
+        6. Rules without an operator, only checking the type.
+        """
+        if rule.operator == rule._true:
+            return 5
+
+        if rule.element == "any argument":
+            return 4
+
+        if rule.element == "number of arguments":
+            return 1
+
+        if rule.operator in (rule._equals, rule._in):
+            return 0 if rule.element == "function name" else 2
+
+        return 3
+
+    def _get_argc_rule(self):
+        """Find the rule that requires an exact number of arguments, or None if there is no such rule."""
         for rule in self.rules:
+            if (
+                rule.element == "number of arguments"
+                and rule.operator == rule._equals
+                and rule.type == Rule.Type.NUMBER
+                and isinstance(rule.value, int)
+            ):
+                return rule
 
-            if rule.element == "function name":
-                result = rule.match(call.function_name)
+        return None
 
-            elif rule.element == "number of arguments":
-                result = rule.match(call.number_of_arguments)
+    def _get_function_name_rule(self):
+        """
+        Find the rule that pins down the function name, or None if there is no such rule.
 
-            elif rule.element == "argument":
-                if rule.argument_index < call.number_of_arguments:
-                    result = rule.match(call.arguments[rule.argument_index])
-                else:
-                    result = False
+        Only rules that compare the function name to strings with the equals or in operator pin down the function name.
+        """
+        for rule in self.rules:
+            if rule.element != "function name" or rule.type != Rule.Type.STRING:
+                continue
 
-            elif rule.element == "any argument":
-                result = False
-                for argument in call.arguments:
-                    if rule.match(argument):
-                        result = True
-                        break
+            if rule.operator in (rule._equals, rule._in):
+                return rule
 
-            else:
-                raise ValueError(f"Unknown name: {rule.element}")
+        return None
 
-            self.logger.debug(f"{str(call)}: {str(rule)} -> {result}")
+    def _get_function_names(self):
+        """
+        Find the (casefolded) function names a call needs to have to match the Call Signature.
+
+        If no rule pins down the function name, None is returned.
+        """
+        rule = self._function_name_rule
+        if rule is None:
+            return None
+
+        if rule.operator == rule._equals:
+            values = [rule._value_cf]
+        elif isinstance(rule._value_cf, list):
+            values = rule._value_cf
+        else:
+            values = []
+
+        return frozenset(value for value in values if isinstance(value, str))
+
+    def match(self, call: Call) -> bool:
+        """
+        Compare a call with all rules of the Call Signature.
+
+        First reject calls with the wrong number of arguments, then compare the other rules one by one.
+        The plugin itself matches through a SignatureIndex, which checks the function name and
+        number of arguments per bucket and then only calls `match_unkeyed`.
+        """
+        if (
+            self.expected_argc is not None
+            and call.number_of_arguments != self.expected_argc
+        ):
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("%s: %s -> False", call, self._argc_rule)
+            return False
+
+        return self._match_rules(self._remaining_rules, call)
+
+    def match_unkeyed(self, call: Call) -> bool:
+        """
+        Compare a call with the rules that are not covered by the key of a SignatureIndex.
+
+        The call needs to have the expected number of arguments and one of the function names (or an unknown name).
+        """
+        return self._match_rules(self._unkeyed_rules, call)
+
+    def _match_rules(self, rules: list, call: Call) -> bool:
+        """Apply the given rules to a call in order, stopping at the first rule that does not match."""
+        # Only represent the call and rules as strings if they are actually logged
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+
+        for rule in rules:
+            result = rule.apply(call)
+
+            if debug:
+                self.logger.debug("%s: %s -> %s", call, rule, result)
 
             if not result:
                 return False
@@ -169,3 +324,89 @@ class Signature:
                         Signature(os.path.join(subdirectory_path, filename))
                     )
         return signatures
+
+
+class SignatureIndex:
+    """
+    Call Signatures grouped by the function names and number of arguments they require.
+
+    This prevents comparing every call with every Call Signature,
+    as most Call Signatures only apply to calls of a specific function.
+    The rules on the function name and number of arguments are covered by the group,
+    so they only need to be checked once per call instead of once per Call Signature.
+    """
+
+    def __init__(self, signatures: list):
+        """Map each function name and number of arguments to the Call Signatures that require them."""
+        self.by_function_name = {}
+        self.wildcard = []
+
+        self.bytes_arguments = self._get_bytes_arguments(signatures)
+
+        # A key of None means that any function name or number of arguments is allowed
+        self.buckets = {}
+        self.by_argc = {}
+
+        for signature in signatures:
+            argc = signature.expected_argc
+            self.by_argc.setdefault(argc, []).append(signature)
+
+            if signature.function_names is None:
+                self.wildcard.append(signature)
+                self.buckets.setdefault((None, argc), []).append(signature)
+                continue
+
+            for function_name in signature.function_names:
+                self.by_function_name.setdefault(function_name, []).append(signature)
+                self.buckets.setdefault((function_name, argc), []).append(signature)
+
+    @staticmethod
+    def _get_bytes_arguments(signatures: list):
+        """
+        Find the indexes of the arguments for which the bytes of referenced data need to be read.
+
+        Only rules on bytes can match bytes, and rules of an unknown type need to distinguish bytes from unknown values.
+        If such a rule applies to any argument, None is returned, as all arguments need to be read.
+        """
+        bytes_arguments = set()
+        for signature in signatures:
+            for rule in signature.rules:
+                if rule.type not in (Rule.Type.BYTES, Rule.Type.UNKNOWN):
+                    continue
+
+                if rule.element == "any argument":
+                    return None
+
+                elif rule.element == "argument":
+                    bytes_arguments.add(rule.argument_index)
+
+        return frozenset(bytes_arguments)
+
+    def candidates(self, call: Call):
+        """
+        Find the Call Signatures whose function name and number of arguments rules match a call.
+
+        A rule on the function name matches calls to unknown functions,
+        so these calls are only grouped by the number of arguments.
+        """
+        argc = call.number_of_arguments
+
+        if call.function_name_cf is None:
+            return itertools.chain(
+                self.by_argc.get(argc, []), self.by_argc.get(None, [])
+            )
+
+        return itertools.chain(
+            self.buckets.get((call.function_name_cf, argc), []),
+            self.buckets.get((call.function_name_cf, None), []),
+            self.buckets.get((None, argc), []),
+            self.buckets.get((None, None), []),
+        )
+
+    def match(self, call: Call) -> list:
+        """Return the Call Signatures that match a call."""
+        return [
+            signature
+            for signature in self.candidates(call)
+            if signature.match_unkeyed(call)
+        ]
@@ -4,13 +4,78 @@ import logging
 import idaapi
 import idautils
 import idc
+import ida_hexrays
 
 import FIDL.decompiler_utils as du
 
-from CallSignaturesPlugin.signature import Signature, Call
+from CallSignaturesPlugin.signature import Signature, SignatureIndex, Call
 from CallSignaturesPlugin.form import CallSignaturesChoose
 
 
+class CallsCacheHooks:
+    """
+    Clear (part of) the cache of decompiled calls when IDA Pro reports a change.
+
+    This class is combined with one of the IDA Pro hook classes,
+    the subclasses map the relevant events to `_invalidate` or `_invalidate_function`.
+    """
+
+    def __init__(self, calls_cache: dict):
+        """Store a reference to the cache that needs to be cleared."""
+        super().__init__()
+        self.calls_cache = calls_cache
+
+    def _invalidate(self, *_) -> int:
+        """Clear the whole cache. IDA Pro expects the hooks to return 0."""
+        self.calls_cache.clear()
+        return 0
+
+    def _invalidate_function(self, vu, *_) -> int:
+        """Remove the calls of the function shown in a pseudocode view from the cache."""
+        if vu.cfunc is not None:
+            self.calls_cache.pop(vu.cfunc.entry_ea, None)
+        return 0
+
+
+class DatabaseChangeHooks(CallsCacheHooks, idaapi.IDB_Hooks):
+    """
+    Clear the cache of decompiled calls when the database changes.
+
+    Renaming, retyping, patching or redefining functions changes the decompiled calls of their callers.
+    Redefining items (e.g. turning a global into a string literal) changes the values of the arguments.
+    As these changes can affect calls in any function, the whole cache is cleared.
+    """
+
+    renamed = CallsCacheHooks._invalidate
+    ti_changed = CallsCacheHooks._invalidate
+    op_type_changed = CallsCacheHooks._invalidate
+    byte_patched = CallsCacheHooks._invalidate
+    make_code = CallsCacheHooks._invalidate
+    make_data = CallsCacheHooks._invalidate
+    destroyed_items = CallsCacheHooks._invalidate
+    func_updated = CallsCacheHooks._invalidate
+    deleting_func = CallsCacheHooks._invalidate
+
+
+class DecompilerChangeHooks(CallsCacheHooks, ida_hexrays.Hexrays_Hooks):
+    """
+    Remove a function from the cache of decompiled calls when its pseudocode is edited.
+
+    Renaming, retyping or mapping local variables changes the arguments of the decompiled calls.
+    Other edits, such as forcing the type of a call, are only reported as a refresh of the pseudocode.
+    These edits only change the decompilation of the function in the view, so only that function is removed.
+
+    `refresh_pseudocode` is used instead of its replacement `func_printed`,
+    because `func_printed` is raised whenever pseudocode text is generated (also outside of views)
+    and does not pass the view that was edited.
+    """
+
+    lvar_name_changed = CallsCacheHooks._invalidate_function
+    lvar_type_changed = CallsCacheHooks._invalidate_function
+    lvar_mapping_changed = CallsCacheHooks._invalidate_function
+    refresh_pseudocode = CallsCacheHooks._invalidate_function
+
+
 class CallSignaturesPlugin(idaapi.plugin_t):
     """An IDA Pro plugin that searches for function calls."""
 
@@ -18,7 +83,9 @@ class CallSignaturesPlugin(idaapi.plugin_t):
 
     wanted_name = PLUGIN_NAME
     wanted_hotkey = "Alt-Shift-D"
-    flags = idaapi.PLUGIN_UNL
+
+    # The plugin is kept loaded between runs, so the decompiled calls can be reused
+    flags = 0
 
     comment = ""
     help = ""
@@ -40,8 +107,15 @@ class CallSignaturesPlugin(idaapi.plugin_t):
         self.logger.setLevel(logging.INFO)
 
         self.signatures = []
+        self.signature_index = None
         self.chooser_tab = None
 
+        self._interesting_names = frozenset()
+        self._has_wildcard_name_signatures = True
+
+        self._calls_cache = {}
+        self._hooks = []
+
     def init(self):
         """
         Initialize the plugin by reading the Call Signature YAML files and opening a tab.
@@ -57,11 +131,23 @@ class CallSignaturesPlugin(idaapi.plugin_t):
             "signatures",
         )
         self.signatures = Signature.read_signatures(signatures_path)
+        self.signature_index = SignatureIndex(self.signatures)
+
+        # If every Call Signature requires a function name, calls to other functions can be skipped entirely
+        self._interesting_names = frozenset(self.signature_index.by_function_name)
+        self._has_wildcard_name_signatures = len(self.signature_index.wildcard) > 0
 
         self.chooser_tab = CallSignaturesChoose(CallSignaturesPlugin.PLUGIN_NAME)
         self.chooser_tab.Show()
 
-        return idaapi.PLUGIN_OK
+        self._hooks.append(DatabaseChangeHooks(self._calls_cache))
+        if ida_hexrays.init_hexrays_plugin():
+            self._hooks.append(DecompilerChangeHooks(self._calls_cache))
+
+        for hooks in self._hooks:
+            hooks.hook()
+
+        return idaapi.PLUGIN_KEEP
 
     def run(self, args):
         """
@@ -69,32 +155,70 @@ class CallSignaturesPlugin(idaapi.plugin_t):
 
         1. Decompile all functions.
         2. Find all calls in a (decompiled) function.
-        3. Check whether a function matches a Call Signature.
+        3. Check whether a function matches one of the Call Signatures that might apply to it.
+
+        The functions are processed one at a time on the main thread,
+        as the IDA Pro API (including the decompiler) is not thread-safe.
         """
         self.logger.debug("Running")
-        for ea in idautils.Functions():
 
-            name = idaapi.get_name(ea)
+        self.chooser_tab.clear_items()
+        self.chooser_tab.Show()
+
+        matches = []
+        for ea in list(idautils.Functions()):
+            for call, signature in self._match_function(ea):
+                matches.append((call, signature))
+                self.logger.info(f"MATCH: [{signature.filename}] {str(call)}")
 
-            # Skip library functions (FUNC_LIB) and dynamically linked functions (FUNC_THUNK)
-            if idc.get_func_flags(ea) & (idaapi.FUNC_LIB | idaapi.FUNC_THUNK):
-                continue
+        # Refresh the tab only once, instead of once per match
+        self.chooser_tab.add_items(matches)
 
-            self.logger.debug(f"Decompiling function: {name}")
+    def _match_function(self, ea: int) -> list:
+        """Decompile a function and return the pairs of calls and Call Signatures that match."""
+        # Skip library functions (FUNC_LIB) and dynamically linked functions (FUNC_THUNK)
+        if idc.get_func_flags(ea) & (idaapi.FUNC_LIB | idaapi.FUNC_THUNK):
+            return []
 
-            try:
-                c = du.controlFlowinator(ea)
-            except (RuntimeError, IndexError):
-                self.logger.warning(f"Failed to decompile: {name}")
-                continue
+        calls = self._calls_cache.get(ea)
+        if calls is None:
+            calls = self._decompile_calls(ea)
 
-            for call_object in c.calls:
-                call = Call(call_object)
+            if calls is None:
+                return []
 
-                for signature in self.signatures:
-                    if signature.match(call):
-                        self.chooser_tab.add_item(call, signature)
-                        self.logger.info(f"MATCH: [{signature.filename}] {str(call)}")
+            self._calls_cache[ea] = calls
+
+        matches = []
+        for call in calls:
+            for signature in self.signature_index.match(call):
+                matches.append((call, signature))
+
+        return matches
+
+    def _decompile_calls(self, ea: int):
+        """Decompile a function and wrap the calls in it, or return None if decompiling fails."""
+        name = idaapi.get_name(ea)
+        self.logger.debug(f"Decompiling function: {name}")
+
+        try:
+            c = du.controlFlowinator(ea)
+        except (RuntimeError, IndexError):
+            self.logger.warning(f"Failed to decompile: {name}")
+            return None
+
+        return [
+            Call(call_object, self.signature_index.bytes_arguments)
+            for call_object in c.calls
+            if self._is_interesting(Call.get_function_name(call_object))
+        ]
+
+    def _is_interesting(self, function_name) -> bool:
+        """Check whether a call to a function with this name can match any Call Signature."""
+        if self._has_wildcard_name_signatures or function_name is None:
+            return True
+
+        return function_name.casefold() in self._interesting_names
 
     def term(self):
         """
@@ -104,6 +228,9 @@ class CallSignaturesPlugin(idaapi.plugin_t):
         """
         self.logger.debug("Terminating")
 
+        for hooks in self._hooks:
+            hooks.unhook()
+
 
 def PLUGIN_ENTRY() -> CallSignaturesPlugin:
     """IDA Pro calls this function when the plugin is run."""